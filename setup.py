@@ -31,10 +31,11 @@ setup(
         'pennylane',
         'pennylane-qiskit',
         'torch',
-        'torch_geometric',
+        'torch_geometric>=2.5',
 
         # ML Tools
         'lightning',
+        'torchmetrics',
         'wandb',
     ],
     classifiers=[
@@ -1,17 +1,67 @@
 """Lightning data module"""
 
 import functools
-import itertools
+import hashlib
+import os
 from typing import Optional
 
 import awkward as ak
 import lightning as L
 import numpy as np
 import torch
-import torch.nn as nn
 from torch.utils.data import DataLoader as TorchDataLoader
+from torch_geometric import EdgeIndex
 from torch_geometric.data import Data
-from torch_geometric.loader import DataLoader as GeoDataLoader
+
+from source.utils.path import root_path
+
+cache_dir = os.path.join(root_path, 'dataset', 'cache')
+
+# Version of the cached datasets, bump it whenever `_preprocess`,
+# `_dataset` or the structure of the saved datasets changes.
+CACHE_VERSION = 4
+
+
+def _log(message: str) -> None:
+    """Printing function for log."""
+    print(f"# DataLog: {message}")
+
+
+def collate_complete_graphs(batch: list[tuple[torch.Tensor, torch.Tensor]]) -> Data:
+    """Collate jets into a batch of fully-connected graphs.
+
+    Instead of creating a `Data` object for each jet and collating them
+    with PyG, node features are concatenated, and the fully-connected
+    edges (including self loop) of all graphs are built at once with
+    node offsets of each graph. The edges are sorted by row, which is
+    the aggregation index of `flow='target_to_source'`, so PyG can
+    aggregate messages with segment reductions instead of scattering.
+
+    Args:
+        batch : list[tuple[torch.Tensor, torch.Tensor]]
+            List of (x, y) with x in shape (num_ptcs, 3).
+    """
+
+    x, y = zip(*batch)
+    num_nodes = torch.tensor([len(_x) for _x in x])
+    num_edges = num_nodes ** 2
+    num_graphs = len(num_nodes)
+
+    # Graph index of each node and each edge.
+    node_batch = torch.repeat_interleave(torch.arange(num_graphs), num_nodes)
+    edge_batch = torch.repeat_interleave(torch.arange(num_graphs), num_edges)
+
+    # Local edge index (a * n + b) within each graph -> global (a, b).
+    node_ptr = torch.cumsum(num_nodes, dim=0) - num_nodes
+    edge_ptr = torch.cumsum(num_edges, dim=0) - num_edges
+    local_index = torch.arange(int(num_edges.sum())) - edge_ptr[edge_batch]
+    n = num_nodes[edge_batch]
+    edge_index = torch.stack((local_index // n, local_index % n), dim=0) + node_ptr[edge_batch]
+
+    total_num_nodes = int(num_nodes.sum())
+    edge_index = EdgeIndex(edge_index, sparse_size=(total_num_nodes, total_num_nodes), sort_order='row')
+
+    return Data(x=torch.cat(x, dim=0), edge_index=edge_index, y=torch.stack(y), batch=node_batch)
 
 
 class TorchDataset(torch.utils.data.Dataset):
@@ -44,6 +94,9 @@ class JetTorchDataModule(L.LightningDataModule):
             batch_size: int,
             max_num_ptcs: Optional[int] = None,
             pi_scale: Optional[bool] = False,
+            num_workers: Optional[int] = 0,
+            pin_memory: Optional[bool] = None,
+            cache_dataset: Optional[bool] = False,
             **kwargs
         ):
         """Pytorch Lightning Data Module for jet.
@@ -63,16 +116,84 @@ class JetTorchDataModule(L.LightningDataModule):
             max_num_ptcs : int (default None)
                 Pad number of particles within jets, used for non-graph
                 data, i.e., `graph == False`.
+            num_workers : int (default 0)
+                Number of subprocesses for data loading. If `None`, use
+                at most 8 workers depending on the number of CPU cores.
+            pin_memory : bool (default None)
+                Whether to use pinned memory in data loaders. If `None`,
+                pin memory only when CUDA is available.
+            cache_dataset : bool (default False)
+                Whether to save the preprocessed datasets in `cache_dir`
+                and load them directly in later runs. The cache file is
+                keyed by the hash of events and the data settings, so it
+                only skips preprocessing, not reading and selecting the
+                events (which must be done before the data module).
         """
 
         super().__init__()
         self.batch_size = batch_size
 
+        # Keyword arguments shared by all data loaders.
+        if num_workers is None:
+            num_workers = min(8, os.cpu_count() or 1)
+        if pin_memory is None:
+            pin_memory = torch.cuda.is_available()
+        self.loader_kwargs = {'batch_size': batch_size, 'num_workers': num_workers, 'pin_memory': pin_memory}
+        if num_workers > 0:
+            # Keep workers alive between epochs and prefetch batches.
+            self.loader_kwargs.update({'persistent_workers': True, 'prefetch_factor': 2})
+
         # Determine maximum number of particles within jets
         if max_num_ptcs is None:
-            max_num_ptcs = max([max(ak.count(_events['pt'], axis=1)) for _events in events])
+            max_num_ptcs = max(int(ak.max(ak.num(_events['pt'], axis=1))) for _events in events)
         self.max_num_ptcs = max_num_ptcs
 
+        # Load preprocessed datasets from cache if exists.
+        cache_path = None
+        if cache_dataset:
+            cache_path = self._cache_path(
+                events, num_train=num_train, num_valid=num_valid, num_test=num_test,
+                max_num_ptcs=max_num_ptcs, pi_scale=pi_scale,
+            )
+
+        if cache_path is not None and os.path.isfile(cache_path):
+            _log(f"Load cached datasets from {cache_path}.")
+            datasets = torch.load(cache_path, map_location='cpu', mmap=True, weights_only=False)
+        else:
+            datasets = self._create_datasets(events, num_train, num_valid, num_test, pi_scale)
+            if cache_path is not None:
+                # Write to a temporary file first, so that parallel runs
+                # never load a partially written cache.
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp_path = cache_path + f".{os.getpid()}.tmp"
+                torch.save(datasets, tmp_path)
+                os.replace(tmp_path, cache_path)
+                _log(f"Save cached datasets to {cache_path}.")
+
+        self.train_dataset, self.valid_dataset, self.test_dataset = datasets
+
+    def _cache_path(self, events: list[ak.Array], **settings) -> str:
+        """Path of the cached datasets, keyed by events and settings."""
+
+        hasher = hashlib.sha1()
+        hasher.update(f"v{CACHE_VERSION}".encode())
+        hasher.update(repr(sorted(settings.items())).encode())
+
+        # Only the fields used in `_preprocess` affect the datasets.
+        for _events in events:
+            _events = ak.to_packed(_events[['fatjet_pt', 'pt', 'delta_eta', 'delta_phi']])
+            form, length, buffers = ak.to_buffers(_events)
+            hasher.update(f"{form.to_json()}{length}".encode())
+            for buffer in buffers.values():
+                hasher.update(np.ascontiguousarray(buffer).data)
+
+        return os.path.join(cache_dir, f"{self.__class__.__name__}-{hasher.hexdigest()}.pt")
+
+    def _create_datasets(
+            self, events: list[ak.Array], num_train: int, num_valid: int, num_test: int, pi_scale: bool
+        ) -> tuple[torch.utils.data.Dataset, torch.utils.data.Dataset, torch.utils.data.Dataset]:
+        """Preprocess events and split into train / valid / test datasets."""
+
         # Preprocess the events.
         events = [self._preprocess(_events, pi_scale) for _events in events]
 
@@ -85,9 +206,11 @@ class JetTorchDataModule(L.LightningDataModule):
         valid_events = [self._dataset(_events, i) for i, _events in enumerate(valid_events)]
         test_events  = [self._dataset(_events, i) for i, _events in enumerate(test_events)]
 
-        self.train_dataset = functools.reduce(lambda x, y: x + y, train_events)
-        self.valid_dataset = functools.reduce(lambda x, y: x + y, valid_events)
-        self.test_dataset  = functools.reduce(lambda x, y: x + y, test_events)
+        train_dataset = functools.reduce(lambda x, y: x + y, train_events)
+        valid_dataset = functools.reduce(lambda x, y: x + y, valid_events)
+        test_dataset  = functools.reduce(lambda x, y: x + y, test_events)
+
+        return train_dataset, valid_dataset, test_dataset
         
     def _preprocess(self, events: ak.Array, pi_scale: bool) -> list[torch.tensor]:
         """Function for preprocessing events."""
@@ -103,24 +226,26 @@ class JetTorchDataModule(L.LightningDataModule):
             f2 = events['delta_eta']
             f3 = events['delta_phi']
         
-        # Since the data size is zig-zag, use list.
-        arrays = ak.zip([f1, f2, f3])
-        arrays = arrays.to_list()
-        events = [torch.tensor(arrays[i]).float() for i in range(len(arrays))]
+        # Since the data size is zig-zag, flatten particles of all jets
+        # into a single (num_ptcs, 3) buffer, then split it into views of
+        # each jet (no per-jet copy).
+        counts = ak.to_numpy(ak.num(f1, axis=1))
+        arrays = [ak.to_numpy(ak.flatten(f, axis=1), allow_missing=False) for f in (f1, f2, f3)]
+        arrays = torch.as_tensor(np.stack(arrays, axis=-1, dtype=np.float32))
+        events = list(torch.split(arrays, counts.tolist()))
         
         return events
 
     def _dataset(self, events: torch.Tensor, y: int) -> TorchDataset:
         
-        # Create padded tensor dataset
-        pad_function = lambda x: nn.functional.pad(
-            input=x,
-            pad=(0, 0, 0, self.max_num_ptcs - len(x)),
-            mode="constant",
-            value=float('nan')
-        )
-        
-        x = list(map(pad_function, events))
+        # Create padded tensor dataset (padded in a single call).
+        if len(events) > 0:
+            x = torch.nested.nested_tensor(events).to_padded_tensor(
+                padding=float('nan'),
+                output_size=(len(events), self.max_num_ptcs, 3),
+            )
+        else:
+            x = torch.empty((0, self.max_num_ptcs, 3))
         y = torch.full((len(events), ), y)
         dataset = TorchDataset(x=x, y=y)
         
@@ -128,43 +253,33 @@ class JetTorchDataModule(L.LightningDataModule):
 
     def train_dataloader(self):
         """Training data loader"""
-        return TorchDataLoader(self.train_dataset, batch_size=self.batch_size, shuffle=True)
+        return TorchDataLoader(self.train_dataset, shuffle=True, **self.loader_kwargs)
 
     def val_dataloader(self):
         """Validation data loader"""
-        return TorchDataLoader(self.valid_dataset, batch_size=self.batch_size, shuffle=False)
+        return TorchDataLoader(self.valid_dataset, shuffle=False, **self.loader_kwargs)
 
     def test_dataloader(self):
         """Testing data loader"""
-        return TorchDataLoader(self.test_dataset, batch_size=self.batch_size, shuffle=False)
+        return TorchDataLoader(self.test_dataset, shuffle=False, **self.loader_kwargs)
 
 
 class JetGraphDataModule(JetTorchDataModule):
     """Data module for torch_geometric.data.Data."""
     
-    def _dataset(self, events: torch.Tensor, y: int) -> list:
-
-        # Create graph structure dataset
-        dataset = []
+    def _dataset(self, events: list[torch.Tensor], y: int) -> TorchDataset:
 
-        for i in range(len(events)):
-            x = events[i]
-
-            # Use fully-connected edges (including self loop).
-            edge_index = list(itertools.product(range(len(x)), range(len(x))))
-            edge_index = torch.tensor(edge_index, requires_grad=False)
-            edge_index = edge_index.transpose(0, 1).contiguous()
-
-            # Turn into pytorch_geometric "Data" object
-            dataset.append(Data(x=x, edge_index=edge_index, y=y))
+        # Graph structures are created in `collate_complete_graphs`.
+        y = torch.full((len(events), ), y)
+        dataset = TorchDataset(x=events, y=y)
 
         return dataset
 
     def train_dataloader(self):
-        return GeoDataLoader(self.train_dataset, batch_size=self.batch_size, shuffle=True)
+        return TorchDataLoader(self.train_dataset, shuffle=True, collate_fn=collate_complete_graphs, **self.loader_kwargs)
 
     def val_dataloader(self):
-        return GeoDataLoader(self.valid_dataset, batch_size=self.batch_size, shuffle=False)
+        return TorchDataLoader(self.valid_dataset, shuffle=False, collate_fn=collate_complete_graphs, **self.loader_kwargs)
 
     def test_dataloader(self):
-        return GeoDataLoader(self.test_dataset, batch_size=self.batch_size, shuffle=False)
\ No newline at end of file
+        return TorchDataLoader(self.test_dataset, shuffle=False, collate_fn=collate_complete_graphs, **self.loader_kwargs)
@@ -198,35 +198,37 @@ class FatJetEvents:
 
         # Determine the lower and upper limits of pt.
         events = self.events
-        pt_min = self.pt_min if self.pt_min != -1 else min(events['fatjet_pt'])
-        pt_max = self.pt_max if self.pt_max != -1 else max(events['fatjet_pt'])
+        pt_min = self.pt_min if self.pt_min != -1 else ak.min(events['fatjet_pt'])
+        pt_max = self.pt_max if self.pt_max != -1 else ak.max(events['fatjet_pt'])
         bin_interval = (pt_max - pt_min) / self.num_bins
 
+        # Bin index of each event in a single pass, where bin `i` is
+        # [bin_lower, bin_upper), and -1 for events outside all bins.
+        bin_edges = [pt_min + bin_interval * i for i in range(self.num_bins + 1)]
+        bin_index = np.digitize(ak.to_numpy(events['fatjet_pt']), bin_edges) - 1
+        if self.num_ptcs_range is not None:
+            num_ptcs = ak.to_numpy(ak.num(events['pt']))
+            bin_index[(num_ptcs < self.num_ptcs_range[0]) | (num_ptcs > self.num_ptcs_range[1])] = -1
+
         # Uniformly generate events in each pt bin.
-        events_buffer = []
+        events_index = []
         for i in range(self.num_bins):
-            bin_lower = pt_min + bin_interval * i
-            bin_upper = pt_min + bin_interval * (i + 1)
-            bin_selected = (events['fatjet_pt'] >= bin_lower) * (events['fatjet_pt'] < bin_upper)
-            if self.num_ptcs_range is not None:
-                num_ptcs = ak.num(events['pt'])
-                bin_selected = bin_selected & (num_ptcs >= self.num_ptcs_range[0])
-                bin_selected = bin_selected & (num_ptcs <= self.num_ptcs_range[1])
-            bin_events = events[bin_selected]
+            bin_events_index = np.flatnonzero(bin_index == i)
 
             # Randomly select uniform events in each pt bin.
-            if self.num_data_per_bin > len(bin_events):
-                raise ValueError(f"{self.channel} # of data per bin {self.num_data_per_bin} > {len(bin_events)}")
-            rnd_index = random.sample(range(len(bin_events)), self.num_data_per_bin)
-            events_buffer.append(bin_events[rnd_index])
+            if self.num_data_per_bin > len(bin_events_index):
+                raise ValueError(f"{self.channel} # of data per bin {self.num_data_per_bin} > {len(bin_events_index)}")
+            rnd_index = random.sample(range(len(bin_events_index)), self.num_data_per_bin)
+            events_index.append(bin_events_index[rnd_index])
 
-        return ak.concatenate(events_buffer)
+        # Select events of all bins at once.
+        return events[np.concatenate(events_index)]
     
     def print_bin_info(self):
 
         events = self.events
-        pt_min = self.pt_min if self.pt_min != -1 else min(events['fatjet_pt'])
-        pt_max = self.pt_max if self.pt_max != -1 else max(events['fatjet_pt'])
+        pt_min = self.pt_min if self.pt_min != -1 else ak.min(events['fatjet_pt'])
+        pt_max = self.pt_max if self.pt_max != -1 else ak.max(events['fatjet_pt'])
         bin_interval = (pt_max - pt_min) / self.num_bins
         
         print(f"---------- {self.channel} ----------")
@@ -16,7 +16,6 @@ can be found at
 
 from typing import Optional
 
-import torch
 import torch.nn as nn
 import torch_geometric.nn as geo_nn
 
@@ -24,32 +23,45 @@ from . import classical
 
 
 class MessagePassing(geo_nn.MessagePassing):
-    def __init__(self, phi: nn.Module, aggr: Optional[str] = 'add'):
+    def __init__(self, phi: classical.ClassicalMLP, aggr: Optional[str] = 'add'):
         """Undirected message passing model.
         See "Creating Message Passing Networks"
         https://pytorch-geometric.readthedocs.io/en/latest/tutorial/create_gnn.html
         
         Args:
-            phi : nn.Module
-                The correlation function between nodes.
+            phi : classical.ClassicalMLP
+                The correlation function between nodes, acting on the
+                concatenated features `(x_i, x_j)`.
             aggr : str
                 Aggregation method, ex: 'max', 'mean', 'add', etc.
         """
 
         super().__init__(aggr=aggr, flow='target_to_source')
 
+        # `forward` splits the weight of the first linear layer of `phi`
+        # into the parts acting on `x_i` and `x_j`.
+        linear = phi.net[0]
+        assert isinstance(linear, nn.Linear) and linear.in_features % 2 == 0, \
+            f"The first layer of `phi` must be `nn.Linear` on `cat(x_i, x_j)`, but got {linear}."
         self.phi = phi
     
     def forward(self, x, edge_index):
-        # Want to calculate
-        return self.propagate(edge_index, x=x)
+        # The first linear layer of `phi` on `cat(x_i, x_j)` equals to
+        # `W_i @ x_i + W_j @ x_j + b`, so both parts are applied on nodes
+        # before message passing, without creating (E, 2F) edge features.
+        linear = self.phi.net[0]
+        weight_i, weight_j = linear.weight.chunk(2, dim=-1)
+        u = nn.functional.linear(x, weight_i, linear.bias)
+        v = nn.functional.linear(x, weight_j)
+        return self.propagate(edge_index, u=u, v=v)
     
-    def message(self, x_i, x_j):
-        # `x_i` and `x_j` are source node and target node respectively.
-        return self.phi(torch.cat((x_i, x_j), dim=-1))
+    def message(self, u_i, v_j):
+        # `i` and `j` are source node and target node respectively.
+        # Remaining layers of `phi` after the first linear layer.
+        return self.phi.net[1:](u_i + v_j)
     
-    def update(self, aggr_out, x):
-        # Set `gamma` as identity function, so `x` will not be used.
+    def update(self, aggr_out):
+        # Set `gamma` as identity function.
         return aggr_out
 
 
@@ -2,7 +2,7 @@
 
 Note that there are two encoding functions below
     - pennylane_encoding: for simulation using PennyLane (such as 
-      'default.qubit').
+      'default.qubit' or 'lightning.qubit').
     - qiskit_encoding: The multi-qubit gates in `pennylane_encoding` are
       decomposed to single-qubit and two-qubit gates. The decomposition
       method can be found at Quantum Computation and Quantum Information
@@ -148,7 +148,7 @@ class QCGNN_IX(nn.Module):
             num_reupload: int,
             num_rotation: int,
             vqc_ansatz: Operation,
-            qdevice: Optional[str] = 'default.qubit',
+            qdevice: Optional[str] = 'lightning.qubit',
             qbackend: Optional[str] = '',
             diff_method: Optional[str] = 'best',
             shots: Optional[int] = 1024,
@@ -161,7 +161,8 @@ class QCGNN_IX(nn.Module):
 
         We first specify the quantum device (either PennyLane simulator
         or IBM quantum systems). The default setup is PennyLane's
-        default quantum simulator. To use IBM quantum systems, see
+        C++ state-vector simulator 'lightning.qubit'. To use IBM
+        quantum systems, see
         https://docs.pennylane.ai/projects/qiskit/en/latest/devices/ibmq.html
         for further detail.
 
@@ -188,7 +189,7 @@ class QCGNN_IX(nn.Module):
             vqc_ansatz : Operation
                 The VQC ansatz, either `qml.BasicEntanglerLayers` or
                 `qml.StronglyEntanglingLayers`.
-            qdevice : Optional[str] (default 'default.qubit')
+            qdevice : Optional[str] (default 'lightning.qubit')
                 Quantum device provided by PennyLane qml.
             qbackend : Optional[str] (default '')
                 If using IBM quantum systems, this argument corresponds
@@ -197,6 +198,8 @@ class QCGNN_IX(nn.Module):
             diff_method : Optional[str] (default 'best')
                 The method for calculating gradients. Note in real 
                 devices, usually only "parameter-shift" is allowed.
+                For 'lightning' simulators, 'best' is resolved to
+                'adjoint' (all gradients in a single backward sweep).
             shots : Optional[int] (default 1024)
                 Number of measurement shots. For PennyLane ideal 
                 simulators, `shots` can be ignored since the returned
@@ -215,10 +218,15 @@ class QCGNN_IX(nn.Module):
         self.num_reupload = num_reupload
         self.aggregation = aggregation
         self.noise_prob = noise_prob
-        self.diff_method = diff_method
         self.num_rotation = num_rotation
         self.vqc_ansatz = vqc_ansatz
 
+        # Lightning simulators support adjoint differentiation, which is
+        # much cheaper than parameter-shift (one circuit per parameter).
+        if diff_method == 'best' and qdevice.startswith('lightning'):
+            diff_method = 'adjoint'
+        self.diff_method = diff_method
+
         # Determine the encoding method.
         if ('qiskit' in qdevice) or ('qiskit' in qbackend):
             self.encoding = qiskit_encoding(num_ir_qubits, num_nr_qubits)
@@ -243,6 +251,14 @@ class QCGNN_IX(nn.Module):
         self.ir_wires = range(num_ir_qubits)
         self.nr_wires = range(num_ir_qubits + num_wk_qubits, num_qubits)
 
+        # Control values of each IR index, `control_values` in pennylane
+        # needs list[int]. These only depend on the circuit structure, so
+        # we build them once instead of every time the QNode is traced.
+        self.control_values = [
+            list(map(int, np.binary_repr(ir_idx, width=num_ir_qubits)))
+            for ir_idx in range(2 ** num_ir_qubits)
+        ]
+
         # Create quantum device.
         if 'qiskit' in qdevice:
             # If real device -> specify backend and shots.
@@ -253,6 +269,10 @@ class QCGNN_IX(nn.Module):
         elif qdevice == 'default.mixed':
             # Used for noise.
             self.qml_device = qml.device(qdevice, wires=num_qubits, shots=shots)
+        elif qdevice.startswith('lightning'):
+            # Compute the adjoint jacobian of the (2 ** n_I) * n_Q
+            # observables in parallel over observables.
+            self.qml_device = qml.device(qdevice, wires=num_qubits, batch_obs=True)
         else:
             # Other quantum simulators (including default.qubit).
             self.qml_device = qml.device(qdevice, wires=num_qubits)
@@ -268,6 +288,9 @@ class QCGNN_IX(nn.Module):
     def build_full_circuit(self):
         """Build up the quantum circuit."""
 
+        # Get observable list (built once, reused by every call of the QNode).
+        pauli_words = self.pauli_words_of_IX_combinations()
+
         @qml.qnode(self.qml_device, diff_method=self.diff_method)
         def full_circuit(inputs: torch.Tensor, weights: torch.Tensor):
             # In `pennylane>=0.31.0`, the inputs will be reshaped as (-1, inputs.shape[-1])
@@ -281,9 +304,6 @@ class QCGNN_IX(nn.Module):
             # Data reupload and VQC.
             self.circuit_evolve(inputs, weights)
 
-            # Get observable list.
-            pauli_words = self.pauli_words_of_IX_combinations()
-
             return [qml.expval(paruli_word) for paruli_word in pauli_words]
 
         return full_circuit
@@ -328,11 +348,7 @@ class QCGNN_IX(nn.Module):
             for ir_idx, _x in enumerate(x.unbind(dim=-2)):
 
                 # Control values depending on the index of IR.
-                control_values = np.binary_repr(ir_idx, width=self.num_ir_qubits)
-                control_values = list(map(int, control_values))
-
-                # `control_values` in pennylane needs list[int]
-                self.encoding(_x, control_values=control_values)
+                self.encoding(_x, control_values=self.control_values[ir_idx])
 
                 # Noise channel 2.
                 self.random_noise()
@@ -444,6 +460,13 @@ class QCGNN_H(QCGNN_IX):
     def build_full_circuit(self):
         """Build up the quantum circuit."""
 
+        # Get observable list (built once, reused by every call of the QNode).
+        observables = [qml.PauliZ(wires) for wires in self.nr_wires]
+        IR_prob_dim = 2 ** self.num_ir_qubits
+        prob0_obs = np.zeros((IR_prob_dim, IR_prob_dim))
+        prob0_obs[0][0] = 2 ** self.num_ir_qubits
+        prob0_obs = qml.Hermitian(prob0_obs, wires=self.ir_wires)
+
         @qml.qnode(self.qml_device, diff_method=self.diff_method)
         def full_circuit(inputs: torch.Tensor, weights: torch.Tensor):
             """
@@ -461,13 +484,6 @@ class QCGNN_H(QCGNN_IX):
             # Different from QCGNN_IX, we add Hadamard transform to IR.
             qml.broadcast(qml.Hadamard, pattern='single', wires=self.ir_wires)
 
-            # Get observable list.
-            observables = [qml.PauliZ(wires) for wires in self.nr_wires]
-            IR_prob_dim = 2 ** self.num_ir_qubits
-            prob0_obs = np.zeros((IR_prob_dim, IR_prob_dim))
-            prob0_obs[0][0] = 2 ** self.num_ir_qubits
-            prob0_obs = qml.Hermitian(prob0_obs, wires=self.ir_wires)
-
             return [qml.expval(prob0_obs @ obs_str) for obs_str in observables]
 
         return full_circuit
@@ -20,7 +20,8 @@ class QuantumMLP(nn.Module):
             num_layers: int,
             num_reupload: int,
             measurements: list[int, str],
-            qdevice: str = 'default.qubit'
+            qdevice: str = 'lightning.qubit',
+            diff_method: str = 'best',
         ):
         """Quantum version MLP (feed forward QNN)
 
@@ -41,8 +42,11 @@ class QuantumMLP(nn.Module):
                 the qubit to be measured. The second element corresponds
                 to the measurement basis, with value as a string "I", 
                 "X", "Y" or "Z".
-            qdevice : str ("default.qubit")
+            qdevice : str ("lightning.qubit")
                 Quantum device provided by PennyLane qml.
+            diff_method : str ("best")
+                The method for calculating gradients. For 'lightning'
+                simulators, 'best' is resolved to 'adjoint'.
         """
 
         super().__init__()
@@ -54,8 +58,12 @@ class QuantumMLP(nn.Module):
             'Z': qml.PauliY,
         }
         
+        # Lightning simulators compute all gradients in one adjoint sweep.
+        if diff_method == 'best' and qdevice.startswith('lightning'):
+            diff_method = 'adjoint'
+
         # Quantum circuit.
-        @qml.qnode(qml.device(qdevice, wires=num_qubits))
+        @qml.qnode(qml.device(qdevice, wires=num_qubits), diff_method=diff_method)
         def circuit(inputs, weights):
 
             # Data reupload.
@@ -1,15 +1,38 @@
 """Lightning Module for ML models."""
 
+import itertools
 import time
 
 import lightning as L
-from sklearn import metrics
 import torch
 import torch.nn as nn
 from torch_geometric.data import Data
+from torchmetrics import Metric
+from torchmetrics.functional.classification import binary_auroc
+from torchmetrics.utilities import dim_zero_cat
 
 # Order of lightning hooks https://pytorch-lightning.readthedocs.io/en/1.7.2/common/lightning_module.html#hooks
 
+class TensorBuffer(Metric):
+    """Concatenate tensors of each step on device.
+
+    Unlike `torchmetrics.CatMetric`, no NaN check is done in `update`,
+    which would synchronize the device every step.
+    """
+
+    full_state_update = False
+
+    def __init__(self):
+        super().__init__()
+        self.add_state('values', default=[], dist_reduce_fx='cat')
+
+    def update(self, value: torch.Tensor):
+        self.values.append(value)
+
+    def compute(self) -> torch.Tensor:
+        return dim_zero_cat(self.values)
+
+
 class TorchLightningModule(L.LightningModule):
     def __init__(self, model: nn.Module, optimizer: torch.optim.Optimizer, score_dim: int, print_log: bool = True):
         """Lightning Module for PyTorch framework."""
@@ -30,18 +53,12 @@ class TorchLightningModule(L.LightningModule):
             self.loss_function = nn.CrossEntropyLoss()
             self.score_function = nn.functional.softmax
 
-        # Buffers for saving tensor result to calculate AUC.
-        self.y_true_buffer = {
-            'train': torch.tensor([]),
-            'valid': torch.tensor([]),
-            'test': torch.tensor([]),
-        }
-
-        self.y_score_buffer = {
-            'train': torch.tensor([]),
-            'valid': torch.tensor([]),
-            'test': torch.tensor([]),
-        }
+        # Metrics accumulating tensor results on device to calculate AUC.
+        # Keys are '{mode}_y_true' and '{mode}_y_score'.
+        self.metric_buffers = nn.ModuleDict({
+            f"{mode}_{target}": TensorBuffer()
+            for mode in ['train', 'valid', 'test'] for target in ['y_true', 'y_score']
+        })
 
     def forward(self, batch: tuple[torch.Tensor, torch.Tensor], mode: str) -> torch.Tensor:
         """Return loss and save tensor buffers."""
@@ -61,15 +78,21 @@ class TorchLightningModule(L.LightningModule):
         assert torch.isfinite(y).all(), f" # ({mode}) Model output contains NaN or Inf."
 
         if self.score_dim == 1:
-            # Sigmoid.
             y = y.view(-1)
-            y_score = self.score_function(y)
-        else:
-            # Softmax.
-            y_score = self.score_function(y, dim=-1)
 
-        self.y_true_buffer[mode] = torch.cat((self.y_true_buffer[mode], y_true.detach().cpu()))
-        self.y_score_buffer[mode] = torch.cat((self.y_score_buffer[mode], y_score.detach().cpu()))
+        # Scores are only used for metrics, so no autograd graph is needed.
+        # Cast to float32 in case of mixed precision, since low precision
+        # scores would create ties and bias the AUC.
+        with torch.no_grad():
+            if self.score_dim == 1:
+                # Sigmoid.
+                y_score = self.score_function(y.float())
+            else:
+                # Softmax.
+                y_score = self.score_function(y.float(), dim=-1)
+
+        self.metric_buffers[f"{mode}_y_true"].update(y_true)
+        self.metric_buffers[f"{mode}_y_score"].update(y_score)
         
         if mode != 'test':
             
@@ -88,38 +111,52 @@ class TorchLightningModule(L.LightningModule):
             return None
 
     def _calculate_metrics(self, mode: str):
-        
-        y_true = self.y_true_buffer[mode]
-        y_score = self.y_score_buffer[mode]
+
+        y_true = self.metric_buffers[f"{mode}_y_true"].compute().long()
+        y_score = self.metric_buffers[f"{mode}_y_score"].compute()
 
         if self.score_dim == 1:
             y_pred = (y_score > 0.5)
+            auc = binary_auroc(y_score, y_true)
 
         elif self.score_dim == 2:
-            y_score = y_score[:, 1] # Defect of sklearn roc_auc_score.
+            y_score = y_score[:, 1]
             y_pred = (y_score > 0.5)
+            auc = binary_auroc(y_score, y_true)
             
         else:
             y_pred = torch.argmax(y_score, dim=-1)
+            auc = self._ovo_auc(y_true, y_score)
 
-        auc = metrics.roc_auc_score(y_true=y_true.int(), y_score=y_score, average='macro', multi_class='ovo')
-        accuracy = metrics.accuracy_score(y_true=y_true, y_pred=y_pred)
+        accuracy = (y_pred.long() == y_true).float().mean()
 
-        return auc, accuracy
+        return auc.item(), accuracy.item()
+
+    def _ovo_auc(self, y_true: torch.Tensor, y_score: torch.Tensor) -> torch.Tensor:
+        """Macro one-vs-one AUC (same as sklearn `multi_class='ovo'`)."""
+
+        auc_list = []
+        for a, b in itertools.combinations(range(self.score_dim), 2):
+            pair_mask = (y_true == a) | (y_true == b)
+            auc_a = binary_auroc(y_score[pair_mask, a], (y_true[pair_mask] == a).long())
+            auc_b = binary_auroc(y_score[pair_mask, b], (y_true[pair_mask] == b).long())
+            auc_list.append((auc_a + auc_b) / 2)
+
+        return torch.stack(auc_list).mean()
     
     def on_train_epoch_start(self):
         self.epoch_start_time = time.time()
-        self.y_true_buffer['train'] = torch.tensor([])
-        self.y_score_buffer['train'] = torch.tensor([])
+        self.metric_buffers['train_y_true'].reset()
+        self.metric_buffers['train_y_score'].reset()
 
     def on_validation_epoch_start(self):
         self.valid_start_time = time.time()
-        self.y_true_buffer['valid'] = torch.tensor([])
-        self.y_score_buffer['valid'] = torch.tensor([])
+        self.metric_buffers['valid_y_true'].reset()
+        self.metric_buffers['valid_y_score'].reset()
 
     def on_test_epoch_start(self):
-        self.y_true_buffer['test'] = torch.tensor([])
-        self.y_score_buffer['test'] = torch.tensor([])
+        self.metric_buffers['test_y_true'].reset()
+        self.metric_buffers['test_y_score'].reset()
 
     def training_step(self, batch: tuple[torch.Tensor, torch.Tensor], batch_idx: int):
         # `training_step` logs will depend on `log_every_n_step`, see https://github.com/Lightning-AI/pytorch-lightning/issues/4479
@@ -153,6 +190,10 @@ class TorchLightningModule(L.LightningModule):
 
         auc, accuracy = self._calculate_metrics(mode=mode)
 
+        # Release the accumulated tensors right after the epoch.
+        self.metric_buffers[f"{mode}_y_true"].reset()
+        self.metric_buffers[f"{mode}_y_score"].reset()
+
         self.log(f"{mode}_accuracy", accuracy, on_epoch=True)
         self.log(f"{mode}_auc", auc, on_epoch=True)
 